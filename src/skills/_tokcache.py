@@ -0,0 +1,32 @@
+"""Shared tiktoken encoder and token-count cache."""
+
+from functools import lru_cache
+
+import tiktoken
+
+ENCODING_NAME = "cl100k_base"
+
+# Token counts keyed by content hash; cleared wholesale once it grows too large
+_COUNT_CACHE: dict[int, int] = {}
+_COUNT_CACHE_MAX = 100_000
+
+
+@lru_cache(maxsize=1)
+def _get_encoder(name: str = ENCODING_NAME) -> tiktoken.Encoding:
+    """Build the encoder once per process."""
+    return tiktoken.get_encoding(name)
+
+
+def cached_count(text: str) -> int:
+    """Count tokens in text, reusing counts for previously seen content."""
+    h = hash(text)
+    count = _COUNT_CACHE.get(h)
+    if count is not None:
+        return count
+
+    if len(_COUNT_CACHE) >= _COUNT_CACHE_MAX:
+        _COUNT_CACHE.clear()
+
+    count = len(_get_encoder(ENCODING_NAME).encode(text))
+    _COUNT_CACHE[h] = count
+    return count
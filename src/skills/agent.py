@@ -1,7 +1,6 @@
 """Agent subprocess that manages project memory skills."""
 
 import asyncio
-import json
 import os
 import signal
 import sys
@@ -9,11 +8,16 @@ import time
 from datetime import datetime
 from pathlib import Path
 
-import tiktoken
+import orjson
 from claude_agent_sdk import query, ClaudeAgentOptions
 
+from skills.utils import append_log
+
 LOG_PATH = Path.home() / ".config" / "skills" / "agent.log"
 
+# Skills dir -> (fingerprint, (skill_tree, existing_skills)), reused across runs in the worker
+_SKILL_CACHE: dict[str, tuple[tuple | None, tuple[str, str]]] = {}
+
 AGENT_PROMPT = '''You are responsible for maintaining the persistent memory for this project as Claude Code skills.
 
 ## Skills Directory Structure
@@ -79,34 +83,76 @@ The main Claude Code agent:
 IMPORTANT: You must use the Write tool to create or edit the skills files.
 '''
 
+# Split once at import so building a prompt is plain concatenation
+_PROMPT_HEAD, _rest = AGENT_PROMPT.split("{transcript_window}", 1)
+_PROMPT_MID, _PROMPT_TAIL = _rest.split("{skill_tree}", 1)
+del _rest
+
 
 def log(message: str) -> None:
     """Log a message to the agent log file."""
-    LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
     timestamp = datetime.now().isoformat()
-    with open(LOG_PATH, "a") as f:
-        f.write(f"[{timestamp}] {message}\n")
+    append_log(LOG_PATH, f"[{timestamp}] {message}\n")
 
 
-def kill_child_processes() -> None:
-    """Kill all child processes of this process."""
+def _proc_child_pids(pid: int) -> list[str] | None:
+    """List child PIDs from /proc, or None if the kernel doesn't expose them."""
+    # Children are recorded per thread, so check every task of this process
+    task_dir = Path("/proc") / str(pid) / "task"
+    try:
+        tasks = list(task_dir.iterdir())
+    except OSError:
+        return None
+
+    child_pids = []
+    for task in tasks:
+        try:
+            child_pids.extend((task / "children").read_text().split())
+        except FileNotFoundError:
+            # Kernel built without CONFIG_PROC_CHILDREN
+            return None
+        except OSError:
+            continue
+    return child_pids
+
+
+def _pgrep_child_pids(pid: int) -> list[str] | None:
+    """List child PIDs with pgrep, or None if it can't be run."""
     import subprocess
-    pid = os.getpid()
     try:
         result = subprocess.run(
             ["pgrep", "-P", str(pid)],
             capture_output=True,
             text=True,
         )
-        child_pids = result.stdout.strip().split("\n")
-        for child_pid in child_pids:
-            if child_pid:
-                try:
-                    os.kill(int(child_pid), signal.SIGTERM)
-                except (ProcessLookupError, ValueError):
-                    pass
-    except Exception:
-        pass
+    except OSError:
+        return None
+    return result.stdout.split()
+
+
+def kill_child_processes() -> None:
+    """Kill all child processes of this process."""
+    pid = os.getpid()
+    child_pids = _proc_child_pids(pid)
+    if child_pids is None:
+        child_pids = _pgrep_child_pids(pid)
+    if child_pids is None:
+        log("kill_child_processes: no /proc children or pgrep, children not killed")
+        return
+
+    for child_pid in child_pids:
+        try:
+            os.kill(int(child_pid), signal.SIGTERM)
+        except (ProcessLookupError, ValueError):
+            pass
+
+
+def _extract_assistant_text(msg: dict) -> str:
+    """Join the text blocks of an assistant transcript message."""
+    content = msg.get("message", {}).get("content", [])
+    if isinstance(content, list):
+        return " ".join(c.get("text", "") for c in content if c.get("type") == "text")
+    return str(content)
 
 
 class Agent:
@@ -118,75 +164,81 @@ class Agent:
         self.transcript_window = context.get("transcript_window", [])
         self.parent_pid = os.getppid()
         self.running = True
-        self.encoder = tiktoken.get_encoding("cl100k_base")
 
     @property
     def skills_dir(self) -> Path:
         return self.cwd / ".claude" / "skills"
 
     def _count_tokens(self, text: str) -> int:
-        """Count tokens in text."""
-        return len(self.encoder.encode(text))
-
-    def _list_skills(self) -> dict[str, list[str]]:
-        """List all skills and their files."""
-        skills = {}
-        if not self.skills_dir.exists():
-            return skills
-
-        for skill_dir in self.skills_dir.iterdir():
-            if skill_dir.is_dir():
-                files = [f.name for f in skill_dir.iterdir() if f.is_file()]
-                skills[skill_dir.name] = files
-        return skills
-
-    def _get_skill_tree(self) -> str:
-        """Get a formatted tree of existing skills."""
-        skills = self._list_skills()
-        if not skills:
-            return "(no skills found)"
-
-        lines = []
-        for skill_name, files in sorted(skills.items()):
-            lines.append(f"- {skill_name}/")
-            for f in sorted(files):
-                lines.append(f"    - {f}")
-        return "\n".join(lines)
-
-    def _read_existing_skills(self) -> str:
-        """Read content of existing skill files."""
-        if not self.skills_dir.exists():
-            return "(no skills)"
+        """Estimate tokens in text (~4 chars per token); only used for logging."""
+        return len(text) // 4
+
+    def _skills_fingerprint(self) -> tuple | None:
+        """Stat-only fingerprint of the skills directory, or None if missing."""
+        try:
+            top_mtime = os.stat(self.skills_dir).st_mtime_ns
+            with os.scandir(self.skills_dir) as it:
+                skill_entries = [e for e in it if e.is_dir()]
+        except FileNotFoundError:
+            return None
+
+        skills = []
+        for skill_entry in skill_entries:
+            # SKILL.md can be rewritten in place without touching its directory
+            try:
+                skill_md_mtime = os.stat(os.path.join(skill_entry.path, "SKILL.md")).st_mtime_ns
+            except FileNotFoundError:
+                skill_md_mtime = None
+            skills.append((skill_entry.name, skill_entry.stat().st_mtime_ns, skill_md_mtime))
+        return top_mtime, tuple(sorted(skills))
+
+    def _scan_skills(self) -> tuple[str, str]:
+        """Return the skill tree and SKILL.md contents, rescanning only on change."""
+        key = str(self.skills_dir)
+        fingerprint = self._skills_fingerprint()
+        cached = _SKILL_CACHE.get(key)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        result = self._read_skills()
+        _SKILL_CACHE[key] = (fingerprint, result)
+        return result
+
+    def _read_skills(self) -> tuple[str, str]:
+        """Scan the skills directory once for the skill tree and SKILL.md contents."""
+        try:
+            with os.scandir(self.skills_dir) as it:
+                skill_entries = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+        except FileNotFoundError:
+            return "(no skills found)", "(no skills)"
 
+        tree_lines = []
         content_parts = []
-        for skill_dir in self.skills_dir.iterdir():
-            if skill_dir.is_dir():
-                skill_md = skill_dir / "SKILL.md"
-                if skill_md.exists():
-                    content_parts.append(f"### {skill_dir.name}/SKILL.md\n```\n{skill_md.read_text()}\n```")
+        for skill_entry in skill_entries:
+            with os.scandir(skill_entry.path) as it:
+                files = sorted(f.name for f in it if f.is_file())
+
+            tree_lines.append(f"- {skill_entry.name}/")
+            tree_lines.extend(f"    - {f}" for f in files)
 
-        return "\n\n".join(content_parts) if content_parts else "(no skills)"
+            if "SKILL.md" in files:
+                with open(os.path.join(skill_entry.path, "SKILL.md")) as f:
+                    content_parts.append(f"### {skill_entry.name}/SKILL.md\n```\n{f.read()}\n```")
+
+        skill_tree = "\n".join(tree_lines) if tree_lines else "(no skills found)"
+        existing_skills = "\n\n".join(content_parts) if content_parts else "(no skills)"
+        return skill_tree, existing_skills
 
     def _format_transcript_window(self) -> str:
         """Format transcript window for the prompt."""
-        if not self.transcript_window:
-            return "(no conversation context)"
-
-        lines = []
-        for msg in self.transcript_window:
-            msg_type = msg.get("type", "unknown")
-            if msg_type == "human":
-                content = msg.get("message", {}).get("content", "")
-                lines.append(f"USER: {content[:500]}")
-            elif msg_type == "assistant":
-                content = msg.get("message", {}).get("content", [])
-                if isinstance(content, list):
-                    text_parts = [c.get("text", "") for c in content if c.get("type") == "text"]
-                    text = " ".join(text_parts)
-                else:
-                    text = str(content)
-                lines.append(f"ASSISTANT: {text[:500]}")
-        return "\n\n".join(lines) if lines else "(no conversation context)"
+        lines = (
+            "USER: " + str(msg.get("message", {}).get("content", ""))[:500]
+            if msg.get("type") == "human"
+            else "ASSISTANT: " + _extract_assistant_text(msg)[:500]
+            for msg in self.transcript_window
+            if msg.get("type") in ("human", "assistant")
+        )
+        return "\n\n".join(lines) or "(no conversation context)"
 
     async def _monitor_parent(self) -> None:
         """Monitor parent process, exit if orphaned.
@@ -201,16 +253,14 @@ class Agent:
     async def process(self) -> str:
         """Process context and manage skills with Claude Agent SDK."""
         transcript_text = self._format_transcript_window()
-        skill_tree = self._get_skill_tree()
-        existing_skills = self._read_existing_skills()
-
-        prompt = AGENT_PROMPT.format(
-            transcript_window=transcript_text,
-            skill_tree=skill_tree,
-        )
+        skill_tree, existing_skills = self._scan_skills()
 
         # Add existing skill content so agent can edit without reading
-        prompt += f"\n\n## Existing Skill Content\n\n{existing_skills}"
+        prompt = (
+            _PROMPT_HEAD + transcript_text
+            + _PROMPT_MID + skill_tree
+            + _PROMPT_TAIL + "\n\n## Existing Skill Content\n\n" + existing_skills
+        )
 
         prompt_tokens = self._count_tokens(prompt)
         log(f"starting: prompt_tokens={prompt_tokens}, transcript_msgs={len(self.transcript_window)}")
@@ -222,12 +272,14 @@ class Agent:
         )
 
         start_time = time.time()
-        result = []
+        message_count = 0
+        last_message = None
         final_text = ""
         async for message in query(prompt=prompt, options=options):
             if not self.running:
                 break
-            result.append(str(message))
+            message_count += 1
+            last_message = message
             # Extract text content from AssistantMessage objects
             if hasattr(message, 'content'):
                 for block in message.content:
@@ -235,13 +287,14 @@ class Agent:
                         final_text = block.text  # Keep last text block as summary
 
         elapsed = time.time() - start_time
-        output = "\n".join(result)
-        output_tokens = self._count_tokens(output)
 
-        log(f"finished: elapsed={elapsed:.1f}s, output_tokens={output_tokens}")
+        log(f"finished: elapsed={elapsed:.1f}s, messages={message_count}")
         log(f"final_text: {final_text if final_text else '(no text)'}")
 
-        return final_text if final_text else output
+        if final_text:
+            return final_text
+        # No text block; fall back to the last raw message
+        return str(last_message) if last_message is not None else ""
 
     async def run(self) -> str:
         """Run agent with parent monitoring."""
@@ -265,8 +318,7 @@ class Agent:
 
 def main() -> None:
     """Entry point when run as subprocess."""
-    data = sys.stdin.read()
-    context = json.loads(data)
+    context = orjson.loads(sys.stdin.buffer.read())
 
     agent = Agent(context)
     try:
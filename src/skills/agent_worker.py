@@ -0,0 +1,38 @@
+"""Long-lived agent worker that serves contexts sent by the overseer."""
+
+import asyncio
+import os
+import sys
+
+from skills.agent import Agent, kill_child_processes, log
+from skills.utils import read_framed_json, write_framed_json
+
+
+def main() -> None:
+    """Run agents for framed JSON contexts on stdin until it closes."""
+    stdin = sys.stdin.buffer
+    # Reserve the real stdout for frames so stray prints can't corrupt them
+    stdout = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    log(f"worker started (pid={os.getpid()})")
+    try:
+        while True:
+            context = read_framed_json(stdin)
+            if context is None:
+                break
+
+            agent = Agent(context)
+            try:
+                result = asyncio.run(agent.run())
+                response = {"ok": True, "result": result}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            write_framed_json(stdout, response)
+    finally:
+        log("worker exiting")
+        kill_child_processes()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
 """Daemon commands for skills CLI."""
 
 import asyncio
-import json
 import os
 import sys
 from pathlib import Path
 
+import orjson
+
 from skills.overseer import Overseer
 
 # dev directory is at repo root: skills/dev
@@ -80,8 +81,8 @@ def start() -> None:
 def notify() -> None:
     """Send hook event to the running overseer via socket."""
     log = _get_log_func()
-    data = json.load(sys.stdin)
-    log(f"notify received: {json.dumps(data)}")
+    data = orjson.loads(sys.stdin.buffer.read())
+    log(f"notify received: {orjson.dumps(data).decode()}")
 
     if not Overseer.is_running():
         log("overseer not running, starting...")
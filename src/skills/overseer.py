@@ -1,23 +1,34 @@
 """Overseer daemon that monitors Claude Code sessions."""
 
 import asyncio
+import fcntl
 import json
 import os
 import signal
-import subprocess
 import sys
+import time
+from collections import deque
 from pathlib import Path
 
-import tiktoken
+import orjson
+
+from skills._tokcache import ENCODING_NAME, _get_encoder, cached_count
+from skills.utils import append_log, get_log_file, pack_frame, read_frame
 
 
 class Overseer:
     """Daemon that listens for hook events and spawns agents."""
 
     PID_FILE = Path("/tmp/skills_overseer.pid")
+    LOCK_FILE = Path("/tmp/skills_overseer.pid.lock")
+    LOCK_ATTEMPTS = 10
     SOCKET_PATH = Path("/tmp/skills_overseer.sock")
     CONFIG_PATH = Path.home() / ".config" / "skills" / "config.json"
     LOG_PATH = Path.home() / ".config" / "skills" / "overseer.log"
+    AGENT_LOG_PATH = Path.home() / ".config" / "skills" / "agent.log"
+
+    # Number of recent messages kept for the agent's transcript window
+    TRANSCRIPT_WINDOW = 50
 
     DEFAULT_CONFIG = {
         "trigger_mode": "tokens",
@@ -27,24 +38,31 @@ class Overseer:
     }
 
     def __init__(self):
-        self.running = False
+        self._stop_event: asyncio.Event | None = None
+        self._agent_task: asyncio.Future | None = None
+        # Only one run at a time may talk to the shared agent worker
+        self._agent_lock = asyncio.Lock()
+        self._lock_fd: int | None = None
         self.session_id: str | None = None
         self.transcript_path: Path | None = None
         self.cwd: Path | None = None
-        self.active_agent: subprocess.Popen | None = None
+        self.agent_worker: asyncio.subprocess.Process | None = None
 
         # Trigger tracking
         self.prompt_count = 0
         self.response_count = 0
         self.tokens_since_last_trigger = 0
-        self.last_transcript_length = 0
+
+        # Incremental transcript state
+        self._transcript_offset = 0
+        self._cached_messages: deque[dict] = deque(maxlen=self.TRANSCRIPT_WINDOW)
+        self._transcript_message_count = 0
+        self._last_transcript_path: Path | None = None
 
         # Load config
+        self._config_mtime = self._get_config_mtime()
         self.config = self._load_config()
 
-        # Token encoder for Claude models
-        self.encoder = tiktoken.get_encoding("cl100k_base")
-
     def _load_config(self) -> dict:
         """Load config or return defaults."""
         if self.CONFIG_PATH.exists():
@@ -53,29 +71,50 @@ class Overseer:
                 return {**self.DEFAULT_CONFIG, **config}
         return self.DEFAULT_CONFIG.copy()
 
+    def _get_config_mtime(self) -> int | None:
+        """Return the config file's mtime, or None if it doesn't exist."""
+        try:
+            return os.stat(self.CONFIG_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh_config(self) -> None:
+        """Reload config if the file has changed since it was last read."""
+        mtime = self._get_config_mtime()
+        if mtime == self._config_mtime:
+            return
+
+        try:
+            self.config = self._load_config()
+        except (OSError, ValueError) as e:
+            # Probably caught mid-write; try again on the next event
+            self._log(f"config reload failed: {e}")
+            return
+        self._config_mtime = mtime
+        self._log(f"config reloaded: {self.config}")
+
     def _log(self, message: str) -> None:
         """Log a message to the shared log file."""
         from datetime import datetime
         # Use same log as agent for consistency
-        log_path = Path.home() / ".config" / "skills" / "agent.log"
-        log_path.parent.mkdir(parents=True, exist_ok=True)
         timestamp = datetime.now().isoformat()
-        with open(log_path, "a") as f:
-            f.write(f"[{timestamp}] overseer: {message}\n")
+        append_log(self.AGENT_LOG_PATH, f"[{timestamp}] overseer: {message}\n")
 
     @classmethod
     def is_running(cls) -> bool:
         """Check if the overseer is already running."""
-        if not cls.PID_FILE.exists():
-            return False
-
+        # A live overseer holds LOCK_FILE exclusively for its whole lifetime
+        fd = os.open(cls.LOCK_FILE, os.O_CREAT | os.O_RDONLY, 0o644)
         try:
-            pid = int(cls.PID_FILE.read_text().strip())
-            os.kill(pid, 0)
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
             return True
-        except (ProcessLookupError, ValueError, FileNotFoundError):
+        else:
+            # Nothing can start while we hold the lock, so leftovers are stale
             cls._cleanup_stale()
             return False
+        finally:
+            os.close(fd)
 
     @classmethod
     def _cleanup_stale(cls) -> None:
@@ -90,80 +129,145 @@ class Overseer:
             return None
         return int(cls.PID_FILE.read_text().strip())
 
-    def _write_pid(self) -> None:
-        """Write current PID to file."""
-        self.PID_FILE.write_text(str(os.getpid()))
+    def _acquire_lock(self) -> bool:
+        """Take the single-instance lock, or return False if another overseer holds it."""
+        fd = os.open(self.LOCK_FILE, os.O_CREAT | os.O_RDWR, 0o644)
+        # is_running() briefly takes a shared lock, so retry for a moment
+        # before concluding another overseer owns it
+        for _ in range(self.LOCK_ATTEMPTS):
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                time.sleep(0.05)
+                continue
+            self._lock_fd = fd
+            return True
+        os.close(fd)
+        return False
+
+    def _release_lock(self) -> None:
+        """Release the single-instance lock."""
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
 
-    def _cleanup(self) -> None:
-        """Clean up PID file, socket, and any active agent."""
-        if self.active_agent and self.active_agent.poll() is None:
-            self.active_agent.terminate()
+    def _write_pid(self) -> None:
+        """Atomically write current PID to file."""
+        tmp_path = self.PID_FILE.with_suffix(".tmp")
+        tmp_path.write_text(str(os.getpid()))
+        os.replace(tmp_path, self.PID_FILE)
+
+    async def _stop_agent_worker(self) -> None:
+        """Terminate the agent worker if it is running."""
+        worker = self.agent_worker
+        self.agent_worker = None
+        if worker and worker.returncode is None:
+            try:
+                worker.terminate()
+            except ProcessLookupError:
+                return
             try:
-                self.active_agent.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.active_agent.kill()
+                await asyncio.wait_for(worker.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                worker.kill()
+                await worker.wait()
+
+    async def _cleanup(self) -> None:
+        """Clean up PID file, socket, and the agent worker."""
+        await self._stop_agent_worker()
 
         self.PID_FILE.unlink(missing_ok=True)
         self.SOCKET_PATH.unlink(missing_ok=True)
+        self._release_lock()
 
     def _count_tokens(self, text: str) -> int:
-        """Count tokens in text using tiktoken."""
-        return len(self.encoder.encode(text))
-
-    def _read_transcript(self) -> list[dict]:
-        """Read all messages from the transcript."""
+        """Count tokens in text using the shared tiktoken cache."""
+        return cached_count(text)
+
+    def _reset_transcript_cache(self) -> None:
+        """Forget everything read from the previous transcript."""
+        self._transcript_offset = 0
+        self._cached_messages.clear()
+        self._transcript_message_count = 0
+        self._last_transcript_path = self.transcript_path
+
+    def _message_tokens(self, msg: dict) -> int:
+        """Count tokens in the text payload of a transcript message."""
+        msg_type = msg.get("type", "")
+        if msg_type == "human":
+            content = msg.get("message", {}).get("content", "")
+            return self._count_tokens(str(content))
+        elif msg_type == "assistant":
+            content = msg.get("message", {}).get("content", [])
+            if isinstance(content, list):
+                return sum(self._count_tokens(c.get("text", "")) for c in content if c.get("type") == "text")
+            return self._count_tokens(str(content))
+        return 0
+
+    def _read_transcript(self) -> tuple[list[dict], int]:
+        """Read messages appended to the transcript since the last call.
+
+        Returns the new messages and the number of tokens they contain.
+        """
         if not self.transcript_path:
             self._log("transcript: no path set")
-            return []
+            return [], 0
         if not self.transcript_path.exists():
             self._log(f"transcript: path doesn't exist: {self.transcript_path}")
-            return []
-
-        messages = []
-        with open(self.transcript_path) as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    try:
-                        messages.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-        return messages
-
-    def _read_transcript_window(self, max_messages: int = 50) -> list[dict]:
-        """Read the most recent messages from the transcript."""
-        messages = self._read_transcript()
-        return messages[-max_messages:]
-
-    def _calculate_new_tokens(self) -> int:
-        """Calculate tokens added since last check."""
-        messages = self._read_transcript()
-        current_length = len(messages)
-
-        if current_length <= self.last_transcript_length:
-            self._log(f"token_calc: no new msgs (current={current_length}, last={self.last_transcript_length})")
-            return 0
-
-        new_messages = messages[self.last_transcript_length:]
-        self._log(f"token_calc: {len(new_messages)} new msgs (transcript has {current_length} total)")
-        self.last_transcript_length = current_length
-
-        total_tokens = 0
+            return [], 0
+
+        if self.transcript_path != self._last_transcript_path:
+            self._reset_transcript_cache()
+
+        with open(self.transcript_path, "rb", buffering=1 << 20) as f:
+            # Transcript was truncated or replaced, start over
+            if os.fstat(f.fileno()).st_size < self._transcript_offset:
+                self._reset_transcript_cache()
+
+            f.seek(self._transcript_offset)
+            data = f.read()
+
+        # Leave any partially written trailing line for the next read
+        end = data.rfind(b"\n") + 1
+        if not end:
+            self._log(f"token_calc: no new msgs (transcript has {self._transcript_message_count} total)")
+            return [], 0
+        new_messages = []
+        for line in data[:end].split(b"\n"):
+            # Only human/assistant messages are counted or shown to the agent,
+            # so skip lines that can't be one without parsing them
+            if b'"human"' not in line and b'"assistant"' not in line:
+                continue
+            try:
+                msg = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            if isinstance(msg, dict) and msg.get("type") in ("human", "assistant"):
+                new_messages.append(msg)
+
+        # Cache the messages and move past them before counting, so a
+        # tokenizer failure can't lose the rest of the chunk
+        self._cached_messages.extend(new_messages)
+        self._transcript_message_count += len(new_messages)
+        self._transcript_offset += end
+
+        new_tokens = 0
+        failures = 0
         for msg in new_messages:
-            msg_type = msg.get("type", "")
-            if msg_type == "human":
-                content = msg.get("message", {}).get("content", "")
-                total_tokens += self._count_tokens(str(content))
-            elif msg_type == "assistant":
-                content = msg.get("message", {}).get("content", [])
-                if isinstance(content, list):
-                    for c in content:
-                        if c.get("type") == "text":
-                            total_tokens += self._count_tokens(c.get("text", ""))
-                else:
-                    total_tokens += self._count_tokens(str(content))
+            try:
+                new_tokens += self._message_tokens(msg)
+            except Exception as e:
+                failures += 1
+                last_error = e
+        if failures:
+            self._log(f"token_calc: failed to count {failures} msgs: {last_error}")
+
+        self._log(f"token_calc: {len(new_messages)} new msgs (transcript has {self._transcript_message_count} total)")
+        return new_messages, new_tokens
 
-        return total_tokens
+    def _read_transcript_window(self) -> list[dict]:
+        """Return the most recent messages already read from the transcript."""
+        return list(self._cached_messages)
 
     def _build_agent_context(self) -> dict:
         """Build context dict to pass to agent subprocess."""
@@ -173,54 +277,77 @@ class Overseer:
             "transcript_window": self._read_transcript_window(),
         }
 
+    async def _get_agent_worker(self) -> asyncio.subprocess.Process:
+        """Return the agent worker, starting it if needed."""
+        if self.agent_worker is None or self.agent_worker.returncode is not None:
+            self.agent_worker = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "skills.agent_worker",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                # Tracebacks and stray output from the worker land in the agent log
+                stderr=get_log_file(self.AGENT_LOG_PATH),
+            )
+            self._log(f"agent worker started (pid={self.agent_worker.pid})")
+        return self.agent_worker
+
     async def _spawn_agent(self) -> str | None:
-        """Spawn agent subprocess with context via stdin."""
+        """Run the agent, waiting for any run already in progress to finish."""
+        async with self._agent_lock:
+            # Shutdown may have started while this run was queued
+            if self._stop_event and self._stop_event.is_set():
+                return None
+            return await self._run_agent()
+
+    async def _run_agent(self) -> str | None:
+        """Send context to the agent worker and wait for its result."""
         context = self._build_agent_context()
 
         try:
-            self.active_agent = subprocess.Popen(
-                [sys.executable, "-m", "skills.agent"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-
-            self.active_agent.stdin.write(json.dumps(context).encode())
-            self.active_agent.stdin.flush()
-            self.active_agent.stdin.close()
+            worker = await self._get_agent_worker()
+            worker.stdin.write(pack_frame(orjson.dumps(context)))
+            await worker.stdin.drain()
 
-            loop = asyncio.get_event_loop()
-            stdout, stderr = await loop.run_in_executor(
-                None,
-                lambda: self.active_agent.communicate(timeout=300),
+            self._agent_task = asyncio.ensure_future(
+                asyncio.wait_for(read_frame(worker.stdout), timeout=300)
             )
+            response = orjson.loads(await self._agent_task)
 
             # Reset trigger counters after agent run
             self.tokens_since_last_trigger = 0
             self.prompt_count = 0
 
-            self._log(f"agent returncode: {self.active_agent.returncode}")
-
-            if self.active_agent.returncode == 0:
-                output = stdout.decode().strip()
+            if response["ok"]:
+                output = response["result"].strip()
                 self._log(f"agent stdout ({len(output)} chars): {output[:1000] if output else '(empty)'}")
                 return output
             else:
-                stderr_text = stderr.decode().strip()
-                self._log(f"agent failed (rc={self.active_agent.returncode}): {stderr_text[:500]}")
+                self._log(f"agent failed: {response['error'][:500]}")
                 return None
 
-        except subprocess.TimeoutExpired:
-            if self.active_agent:
-                self.active_agent.kill()
+        except asyncio.IncompleteReadError:
+            self.tokens_since_last_trigger = 0
+            self.prompt_count = 0
+            self._log(f"agent worker exited (rc={await worker.wait()}), any stderr output is logged above")
+            self.agent_worker = None
+            return None
+        except asyncio.CancelledError:
+            # Shutdown cancelled the run; run() stops the worker
+            self._log("agent run cancelled")
+            return None
+        except asyncio.TimeoutError:
+            # Worker is stuck mid-run; replace it on the next trigger
+            await self._stop_agent_worker()
             return None
         except Exception:
+            await self._stop_agent_worker()
             return None
         finally:
-            self.active_agent = None
+            self._agent_task = None
 
     def _should_trigger_agent(self, event_name: str) -> bool:
         """Decide if we should trigger the agent based on config and conditions."""
+        self._refresh_config()
+
         # Trigger on first response if configured
         if self.config["trigger_on_first_response"]:
             if event_name == "Stop" and self.response_count == 1:
@@ -239,16 +366,28 @@ class Overseer:
                 self._log(f"trigger: prompt_threshold ({self.prompt_count} >= {self.config['prompt_threshold']})")
             return should
 
+    def _log_warmup_failure(self, future: asyncio.Future) -> None:
+        """Log if the background encoder build failed; events will retry it."""
+        if not future.cancelled() and future.exception():
+            self._log(f"encoder warmup failed: {future.exception()}")
+
     async def run(self) -> None:
-        """Run the overseer loop."""
-        self.running = True
+        """Run the overseer until a signal or SessionEnd stops it."""
+        # Concurrent SessionStart hooks can each get here; only one may proceed
+        if not self._acquire_lock():
+            self._log("another overseer holds the lock, exiting")
+            return
+
+        self._stop_event = asyncio.Event()
         self._write_pid()
 
-        def handle_signal(sig, frame):
-            self.running = False
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self._stop_event.set)
+        loop.add_signal_handler(signal.SIGINT, self._stop_event.set)
 
-        signal.signal(signal.SIGTERM, handle_signal)
-        signal.signal(signal.SIGINT, handle_signal)
+        # Build the tokenizer in the background so the first event doesn't wait on it
+        warmup = loop.run_in_executor(None, _get_encoder, ENCODING_NAME)
+        warmup.add_done_callback(self._log_warmup_failure)
 
         self.SOCKET_PATH.unlink(missing_ok=True)
 
@@ -258,10 +397,14 @@ class Overseer:
         )
 
         async with server:
-            while self.running:
-                await asyncio.sleep(0.1)
+            await self._stop_event.wait()
+
+            # Don't let an in-flight agent run hold up shutdown
+            if self._agent_task:
+                self._agent_task.cancel()
+            await self._stop_agent_worker()
 
-        self._cleanup()
+        await self._cleanup()
 
     async def _handle_client(
         self,
@@ -269,20 +412,23 @@ class Overseer:
         writer: asyncio.StreamWriter,
     ) -> None:
         """Handle incoming hook events."""
-        data = await reader.read(65536)
-        message = data.decode()
-
         try:
-            event = json.loads(message)
+            event = orjson.loads(await read_frame(reader))
             await self._process_event(event)
             response = "ok"
         except Exception as e:
             response = f"error: {e}"
 
-        writer.write(response.encode())
-        await writer.drain()
-        writer.close()
-        await writer.wait_closed()
+        # Always close the connection, or the server can't shut down
+        try:
+            writer.write(pack_frame(response.encode()))
+            await writer.drain()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
 
     async def _process_event(self, event: dict) -> None:
         """Process a hook event."""
@@ -295,8 +441,8 @@ class Overseer:
         if "cwd" in event:
             self.cwd = Path(event["cwd"])
 
-        # Calculate new tokens from transcript
-        new_tokens = self._calculate_new_tokens()
+        # Parse and count only what was appended to the transcript
+        _, new_tokens = self._read_transcript()
         self.tokens_since_last_trigger += new_tokens
 
         self._log(f"event={event_name} new_tokens={new_tokens} total_tokens={self.tokens_since_last_trigger} prompts={self.prompt_count} responses={self.response_count}")
@@ -304,7 +450,7 @@ class Overseer:
         if event_name == "SessionEnd":
             # Trigger agent one final time before shutdown
             await self._spawn_agent()
-            self.running = False
+            self._stop_event.set()
 
         elif event_name == "UserPromptSubmit":
             self.prompt_count += 1
@@ -314,7 +460,10 @@ class Overseer:
             self.response_count += 1
 
             if self._should_trigger_agent(event_name):
-                await self._spawn_agent()
+                if self._agent_lock.locked():
+                    self._log("trigger skipped: agent already running")
+                else:
+                    await self._spawn_agent()
 
     @classmethod
     async def send_event(cls, event: dict) -> str | None:
@@ -324,13 +473,12 @@ class Overseer:
 
         try:
             reader, writer = await asyncio.open_unix_connection(str(cls.SOCKET_PATH))
-            writer.write(json.dumps(event).encode())
+            writer.write(pack_frame(orjson.dumps(event)))
             await writer.drain()
-            writer.write_eof()
 
-            response = await reader.read()
+            response = await read_frame(reader)
             writer.close()
             await writer.wait_closed()
             return response.decode()
-        except (ConnectionRefusedError, FileNotFoundError):
+        except (ConnectionRefusedError, FileNotFoundError, asyncio.IncompleteReadError):
             return None
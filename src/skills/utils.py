@@ -1,7 +1,21 @@
 """Utility functions for skills."""
 
+import asyncio
+import atexit
 import json
+import struct
+import threading
 from pathlib import Path
+from typing import BinaryIO, TextIO
+
+import orjson
+
+# Frames are a 4-byte big-endian length followed by a JSON payload
+FRAME_HEADER = struct.Struct(">I")
+
+# Log handles stay open for the life of the process
+_LOG_FILES: dict[Path, TextIO] = {}
+_LOG_LOCK = threading.Lock()
 
 
 def get_settings_path(scope: str) -> Path:
@@ -27,3 +41,61 @@ def save_settings(path: Path, settings: dict) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     with open(path, "w") as f:
         json.dump(settings, f, indent=2)
+
+
+def get_log_file(path: Path) -> TextIO:
+    """Return the cached line-buffered append handle for a log file."""
+    with _LOG_LOCK:
+        fh = _LOG_FILES.get(path)
+        if fh is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fh = open(path, "a", buffering=1)
+            atexit.register(fh.close)
+            _LOG_FILES[path] = fh
+        return fh
+
+
+def append_log(path: Path, line: str) -> None:
+    """Append a line to a log file through a cached line-buffered handle."""
+    get_log_file(path).write(line)
+
+
+def pack_frame(payload: bytes) -> bytes:
+    """Prefix payload with its length."""
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """Read one length-prefixed frame from a stream reader."""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    return await reader.readexactly(length)
+
+
+def write_framed_json(stream: BinaryIO, obj: dict) -> None:
+    """Write obj to a binary stream as a length-prefixed JSON frame."""
+    stream.write(pack_frame(orjson.dumps(obj)))
+    stream.flush()
+
+
+def _read_exactly(stream: BinaryIO, n: int) -> bytes | None:
+    """Read exactly n bytes, or return None if the stream ends first."""
+    buf = b""
+    while len(buf) < n:
+        chunk = stream.read(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+
+
+def read_framed_json(stream: BinaryIO) -> dict | None:
+    """Read one length-prefixed JSON frame, or return None at end of stream."""
+    header = _read_exactly(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    payload = _read_exactly(stream, length)
+    if payload is None:
+        return None
+    return orjson.loads(payload)